@@ -26,15 +26,26 @@ This script:
 - Compares live display vs baseline display for the trap logic.
 """
 
+import collections
+import gzip
+import logging
+import os
+import re
 import sys
 import time
+import queue
 import threading
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+from enum import IntEnum
 from typing import Optional
 
+import orjson
 import requests
 import serial
-from flask import Flask, jsonify, render_template_string
+from flask import Flask, Response, jsonify, request
+from requests.adapters import HTTPAdapter
+
+import fsm_core
 
 # ===================== HARD-CODED CONFIG =====================
 COM_PORT   = r"COM9"      # your USB adapter port (e.g. "COM9" or "/dev/ttyUSB0")
@@ -63,11 +74,22 @@ EP_RESTORE       = "44/0/2"
 EP_TRAPPED       = "44/0/3"
 COMPANION_TIMEOUT = 1.0
 
+# Debug: dump raw serial bytes and parsed frames to the console
+DEBUG = False
+
 # Flask server
 LISTEN_HOST = "0.0.0.0"
 LISTEN_PORT = 8420
 # ============================================================
 
+# FSM timers run on the monotonic clock in integer nanoseconds: immune to
+# NTP/wall-clock steps (a backwards jump could falsely trigger a DROP) and
+# integer compares are cheaper than float arithmetic. The *_S constants
+# above stay for display and the /api config block.
+ARM_HOLD_NS     = int(ARM_HOLD_S * 1e9)
+DROP_HOLD_NS    = int(DROP_HOLD_S * 1e9)
+RESTORE_HOLD_NS = int(RESTORE_HOLD_S * 1e9)
+
 # ----- Serial mode (pyserial) -----
 if USE_7E1:
     BYTESIZE = serial.SEVENBITS
@@ -79,28 +101,126 @@ else:
     STOPBITS = serial.STOPBITS_ONE
 
 
+# Hoisted constants for the per-sample hot path: multiply by the
+# precomputed reciprocal instead of dividing, and skip re-deriving
+# (1 - alpha) on every EMA update.
+_ONE_MINUS_ALPHA = 1.0 - SMOOTH_ALPHA
+_STEP_INV        = 1.0 / DISPLAY_STEP_KG
+
+# Optional NumPy acceleration: folding N samples through the EMA equals
+#   s_new = a*[(1-a)^(N-1) x_0 + ... + (1-a)^0 x_{N-1}] + (1-a)^N * s_old
+# i.e. one SIMD dot product against precomputed powers of (1-a). Only worth
+# it for bursts (N >= 4); small chunks stay on the scalar loop.
+try:
+    import numpy as np
+    _EMA_POWERS = np.power(_ONE_MINUS_ALPHA, np.arange(256))
+except ImportError:
+    np = None
+    _EMA_POWERS = None
+
+_EMA_VECTOR_MIN = 4
+
+
+def ema_fold(samples, smoothed):
+    """Fold an iterable of samples through the EMA, vectorized when a large
+    burst arrives and NumPy is available. Returns the new smoothed value."""
+    n = len(samples)
+    if (np is not None and smoothed is not None
+            and _EMA_VECTOR_MIN <= n < len(_EMA_POWERS)):
+        arr = np.fromiter(samples, dtype=np.float64, count=n)
+        if fsm_core.NUMBA_AVAILABLE:
+            # exact sequential fold, compiled with nogil so Flask keeps
+            # serving while a burst is processed
+            return fsm_core.ema_batch(arr, smoothed, SMOOTH_ALPHA)
+        return (
+            SMOOTH_ALPHA * float(np.dot(_EMA_POWERS[:n][::-1], arr))
+            + float(_EMA_POWERS[n]) * smoothed
+        )
+    for v in samples:
+        if smoothed is None:
+            smoothed = v
+        else:
+            smoothed = SMOOTH_ALPHA * v + _ONE_MINUS_ALPHA * smoothed
+    return smoothed
+
+
 def round_to_step_nearest(x: float, step: float) -> float:
     return round(x / step) * step
 
 
+def round_display(x: float) -> float:
+    """round_to_step_nearest specialized for DISPLAY_STEP_KG."""
+    return round(x * _STEP_INV) * DISPLAY_STEP_KG
+
+
+# ----- Companion press queue -----
+# POSTs used to happen synchronously on the serial reader thread; a slow
+# Companion response would stall parsing of the continuous byte stream.
+# Now press_companion() just enqueues and a worker thread does the HTTP,
+# reusing one keep-alive Session so we don't pay a TCP handshake per event.
+SESSION = requests.Session()
+SESSION.mount(
+    "http://",
+    HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0),
+)
+
+_companion_q: "queue.Queue" = queue.Queue(maxsize=64)
+
+# Coalescing window: presses arriving within this many seconds of the first
+# one are drained and fired back-to-back on the same keep-alive socket.
+_COMPANION_BATCH_WINDOW_S = 0.05
+
+
 def press_companion(endpoint: str) -> bool:
     """
-    Fire a Companion endpoint. Same semantics as your original file.
+    Queue a Companion endpoint press. Returns immediately; the actual POST
+    happens on the companion worker thread.
     """
-    url = f"http://{COMPANION_HOST}:{COMPANION_PORT}/api/location/{endpoint}/press"
     try:
-        requests.post(url, timeout=COMPANION_TIMEOUT)
+        _companion_q.put_nowait((endpoint, time.time()))
         return True
-    except Exception as e:
-        print(f"[WARN] Companion press to {endpoint} failed: {e}")
+    except queue.Full:
+        print(f"[WARN] Companion queue full; dropping press to {endpoint}")
         return False
 
 
-@dataclass
+def companion_worker():
+    """
+    Drain the press queue and fire POSTs on a single keep-alive session.
+    Bursty transitions arriving within the batch window are sent back-to-back.
+    """
+    while True:
+        batch = [_companion_q.get()]
+        deadline = time.time() + _COMPANION_BATCH_WINDOW_S
+        while time.time() < deadline:
+            try:
+                batch.append(_companion_q.get_nowait())
+            except queue.Empty:
+                time.sleep(0.005)
+
+        for endpoint, _ts in batch:
+            url = f"http://{COMPANION_HOST}:{COMPANION_PORT}/api/location/{endpoint}/press"
+            try:
+                SESSION.post(url, timeout=COMPANION_TIMEOUT)
+            except Exception as e:
+                print(f"[WARN] Companion press to {endpoint} failed: {e}")
+
+
+class FsmState(IntEnum):
+    """Game phases as ints: one-instruction compares in the FSM hot path
+    (vs. length+memcmp for strings) and they map 1:1 onto fsm_core's codes.
+    Translated to .name only when serialized for HTTP/console."""
+    WAITING        = fsm_core.WAITING
+    ARMING         = fsm_core.ARMING
+    TRAPPED        = fsm_core.TRAPPED
+    ESCAPE_ATTEMPT = fsm_core.ESCAPE_ATTEMPT
+
+
+@dataclass(slots=True)
 class GameState:
     # high-level state
     armed: bool = False
-    phase: str = "WAITING"   # "WAITING", "ARMING", "TRAPPED", "ESCAPE_ATTEMPT"
+    phase: FsmState = FsmState.WAITING
 
     # raw / actual
     last_raw_kg: Optional[float] = None      # decoded from the scale protocol
@@ -113,10 +233,10 @@ class GameState:
     # baselines
     arming_actual_kg: Optional[float] = None
 
-    # timers
-    arm_start: float = 0.0          # when we first went above trigger (for arming)
-    drop_start: float = 0.0         # when display first fell below baseline
-    restore_start: float = 0.0      # when display first went back above baseline
+    # timers (time.monotonic_ns ticks; 0 = not running)
+    arm_start: int = 0              # when we first went above trigger (for arming)
+    drop_start: int = 0             # when display first fell below baseline
+    restore_start: int = 0          # when display first went back above baseline
 
     # meta
     updated: float = 0.0            # last update timestamp
@@ -130,61 +250,177 @@ state = GameState()
 lock = threading.Lock()
 stop_flag = False
 
+# Set by the publisher whenever a new snapshot lands; SSE generators wake
+# on it instead of clients re-polling /api/state.
+_state_changed = threading.Event()
+
+# Debug log lines buffered here and flushed by logger_loop, so the reader
+# thread never blocks on a stdout write (and skips the formatting entirely
+# when DEBUG is off). Bounded: floods just drop the oldest lines.
+LOG_Q: "collections.deque[str]" = collections.deque(maxlen=256)
+
+
+def logger_loop():
+    """Flush queued debug lines to stdout every 100 ms."""
+    while not stop_flag:
+        if LOG_Q:
+            lines = []
+            while LOG_Q:
+                lines.append(LOG_Q.popleft())
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+        time.sleep(0.1)
+
+# Latest published state for the HTTP path, kept in a one-element list so
+# the dict, its pre-serialized bytes, and a sequence number are swapped as
+# a single atomic unit (CPython list item assignment is one store under the
+# GIL). Readers grab _latest[0] once and get a consistent triple; the
+# monotonically increasing seq lets them detect a disarm/reset in between
+# two reads. The bytes end in ',"now":' so /api/state only appends the
+# timestamp and the closing brace.
+_latest: list = [({}, b"", 0, 'W/"0"')]
+_seq = 0
+
+# The config block never changes; serialize it exactly once.
+_CONFIG_FRAGMENT = b',"config":' + orjson.dumps(dict(
+    MIN_TRIGGER_KG=MIN_TRIGGER_KG,
+    ARM_HOLD_S=ARM_HOLD_S,
+    DISPLAY_STEP_KG=DISPLAY_STEP_KG,
+    DROP_HOLD_S=DROP_HOLD_S,
+    RESTORE_HOLD_S=RESTORE_HOLD_S,
+))
+
+
+def _publish_snapshot_locked():
+    """Rebuild the read-only snapshot. Call with 'lock' held after mutating
+    'state' so HTTP readers always see a consistent view."""
+    global _seq
+    _seq += 1
+    snapshot = {
+        "armed": state.armed,
+        "phase": state.phase.name,
+        "last_raw_kg": state.last_raw_kg,
+        "smoothed_kg": state.smoothed_kg,
+        "display_kg": state.display_kg,
+        "baseline_display_kg": state.baseline_display_kg,
+        "arming_actual_kg": state.arming_actual_kg,
+        "arm_start": state.arm_start,
+        "drop_start": state.drop_start,
+        "restore_start": state.restore_start,
+        "updated": state.updated,
+        "last_segment": state.last_segment,
+        "last_segment_reversed": state.last_segment_reversed,
+        "seq": _seq,
+    }
+    _latest[0] = (
+        snapshot,
+        orjson.dumps(snapshot)[:-1] + _CONFIG_FRAGMENT + b',"now":',
+        _seq,
+        # Weak ETag keyed on the last-frame timestamp: while the scale is
+        # idle, pollers sending If-None-Match get a ~40-byte 304 instead of
+        # the full body.
+        f'W/"{int(state.updated * 1000)}"',
+    )
+    _state_changed.set()
+
+
+_publish_snapshot_locked()
+
+
+# Frame scanner: '=' followed by exactly 7 bytes of digits/dot (the reversed
+# numeric string). A compiled bytes-level regex runs as a C scan instead of
+# the old per-character find/slice loop, and skips the ASCII decode step.
+FRAME_RE = re.compile(rb"=([0-9.]{7})")
 
-def decode_weight_from_stream(buffer: bytearray):
+# Reciprocal powers of ten for the fixed-format parser (a 7-char frame has
+# at most 6 fractional digits).
+_DIVS = (1.0, 0.1, 0.01, 0.001, 1e-4, 1e-5, 1e-6)
+
+
+def parse_frame7(seg: bytes) -> Optional[float]:
     """
-    Consume bytes from 'buffer', looking for '=' and the next 7 characters.
-    Whenever a full frame is found, yield (actual_kg, raw_segment, reversed_segment).
+    Parse the 7-char reversed segment straight into a float.
 
-    This function mutates 'buffer': it removes bytes that have been processed.
+    Walking the raw bytes back-to-front reads the reversed string in
+    natural order, so the reversal and the parse happen in one pass: an
+    integer digit accumulator scaled by 10^-fraction_digits. Avoids
+    float()'s general-purpose string parser and the [::-1] allocation.
+    Returns None on a malformed frame (more than one '.').
+    """
+    val = 0
+    frac = -1   # fractional digits seen so far; -1 = no '.' yet
+    for b in reversed(seg):
+        if b == 0x2E:  # '.'
+            if frac >= 0:
+                return None
+            frac = 0
+        else:
+            val = val * 10 + (b - 48)
+            if frac >= 0:
+                frac += 1
+    if frac > 0:
+        return val * _DIVS[frac]
+    return float(val)
+
+
+# Fixed capacity of the serial parse buffer; the scanner never lets more
+# than TAIL_KEEP unparsed bytes survive a pass, so this never fills in
+# steady state.
+BUF_CAP   = 4096
+TAIL_KEEP = 64
+
+# Compact (left-shift the live region to offset 0) only once the read
+# cursor has drifted this far, instead of memmoving the tail on every
+# frame. Amortizes the shift cost over ~many frames.
+COMPACT_AT = 2048
+
+
+def decode_weight_from_stream(buffer: bytearray, start: int, length: int):
+    """
+    Scan buffer[start:length] of the fixed-capacity 'buffer' for complete
+    frames ('=' + 7 chars), returning (weights, new_start, new_length)
+    where weights is a list of (actual_kg, raw_segment, reversed_segment).
+
+    Consumed bytes just advance the read cursor; the live region is only
+    compacted down to offset 0 (overlap-safe memoryview left shift) once
+    the cursor passes COMPACT_AT. The unparsed tail is capped at TAIL_KEEP
+    bytes so garbage input can't accumulate.
     """
 
     weights = []
+    last_end = start
 
-    while True:
-        try:
-            idx = buffer.index(ord('='))
-        except ValueError:
-            # '=' not found; keep only the tail to avoid unbounded growth
-            if len(buffer) > 32:
-                del buffer[:-32]
-            break
-
-        # Check if we have '=' plus 7 following bytes
-        if idx + 8 <= len(buffer):
-            # segment is the 7 chars after '='
-            seg_bytes = buffer[idx+1:idx+8]
-            # drop everything up through the segment
-            del buffer[:idx+8]
+    for m in FRAME_RE.finditer(buffer, start, length):
+        last_end = m.end()
+        seg_bytes = m.group(1)
 
-            try:
-                seg = seg_bytes.decode("ascii", errors="ignore")
-            except Exception:
-                continue
+        actual = parse_frame7(seg_bytes)
+        if actual is None:
+            # malformed frame (e.g. two dots); skip
+            continue
 
-            if len(seg) != 7:
-                # malformed frame; skip
-                continue
+        # --- NEW RULE: weight is 10% less ---
+        actual = actual * 0.9
 
-            rev = seg[::-1]
-            try:
-                actual = float(rev)
-                
-                # --- NEW RULE: weight is 10% less ---
-                actual = actual * 0.9
+        weights.append((
+            actual,
+            seg_bytes.decode("ascii"),
+            seg_bytes[::-1].decode("ascii"),
+        ))
 
-            except ValueError:
-                # couldn’t parse as float; skip
-                continue
+    if length - last_end > TAIL_KEEP:
+        # no (further) frame in the middle; keep only the newest tail
+        last_end = length - TAIL_KEEP
 
-            weights.append((actual, seg, rev))
-        else:
-            # not enough bytes yet; keep from '=' onwards
-            if idx > 0:
-                del buffer[:idx]
-            break
+    start = last_end
+
+    if start > COMPACT_AT:
+        remain = length - start
+        mv = memoryview(buffer)
+        mv[:remain] = mv[start:length]  # left shift, overlap-safe
+        start, length = 0, remain
 
-    return weights
+    return weights, start, length
 
 
 def reader_loop():
@@ -196,6 +432,20 @@ def reader_loop():
     """
     global stop_flag
 
+    # Give this thread scheduling preference over the Flask workers so the
+    # GIL comes back promptly after each ser.read() and FSM reactions to a
+    # weight drop aren't delayed by a busy overlay.
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            ctypes.windll.kernel32.SetThreadPriority(
+                ctypes.windll.kernel32.GetCurrentThread(), 1
+            )  # THREAD_PRIORITY_ABOVE_NORMAL
+        elif hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, {0})
+    except Exception as e:
+        print(f"[WARN] could not tune reader thread scheduling: {e}")
+
     try:
         ser = serial.Serial(
             port=COM_PORT,
@@ -203,7 +453,7 @@ def reader_loop():
             bytesize=BYTESIZE,
             parity=PARITY,
             stopbits=STOPBITS,
-            timeout=0.2,
+            timeout=0.05,
             rtscts=False,
             dsrdtr=False,
             xonxoff=False,
@@ -212,79 +462,106 @@ def reader_loop():
         print(f"\n[!] ERROR opening {COM_PORT}: {e}")
         sys.exit(1)
 
+    # Windows only: grow the driver RX buffer so a GIL stall can't overrun
+    # it between reads.
+    if hasattr(ser, "set_buffer_size"):
+        try:
+            ser.set_buffer_size(rx_size=65536)
+        except Exception as e:
+            print(f"[WARN] could not set driver RX buffer size: {e}")
+
     print(f"\nConnected: {COM_PORT} @ {BAUD} {'7E1' if USE_7E1 else '8N1'}")
     print("Decoding rule: '=' + 7 chars, reverse them, parse float -> actual kg.")
     print(f"Arming when actual ≥ {MIN_TRIGGER_KG:.1f} kg for {ARM_HOLD_S:.1f}s\n")
     print(f"HTTP overlay at http://{LISTEN_HOST}:{LISTEN_PORT}/\n")
 
-    buf = bytearray()
-    last_log = 0.0
+    buf = bytearray(BUF_CAP)   # preallocated; [buf_start:buf_len] is live
+    buf_start = 0              # read cursor (advanced by the scanner)
+    buf_len = 0                # write head
+
+    # Reads land in this preallocated scratch buffer via readinto, so the
+    # hot loop allocates no fresh bytes object per serial read.
+    scratch = bytearray(BUF_CAP)
+    smv = memoryview(scratch)
 
     while not stop_flag:
         try:
-            chunk = ser.read(64)
-            if chunk:
-                # print raw bytes so you can verify the stream
-                print(f"RAW BYTES: {chunk.hex(' ')} | {repr(chunk)}")
+            # Drain whatever the driver has buffered in one read instead of
+            # five timer-driven 64-byte reads per second; the short timeout
+            # only applies when the port is idle.
+            want = min(max(1, ser.in_waiting), BUF_CAP)
+            n = ser.readinto(smv[:want]) or 0
+            if n:
+                chunk = smv[:n]
+                if DEBUG:
+                    # raw bytes so you can verify the stream
+                    LOG_Q.append(
+                        f"RAW BYTES: {chunk.hex(' ')} | {bytes(chunk)!r}\n"
+                    )
 
-                buf.extend(chunk)
-                frames = decode_weight_from_stream(buf)
+                if n >= BUF_CAP:
+                    # absurdly large read; only the newest bytes can matter
+                    buf[:BUF_CAP] = chunk
+                    buf_start, buf_len = 0, BUF_CAP
+                else:
+                    if buf_len + n > BUF_CAP:
+                        # out of room at the end: compact the live region,
+                        # then (if truly full) keep only the newest bytes
+                        live = buf_len - buf_start
+                        mv = memoryview(buf)
+                        mv[:live] = mv[buf_start:buf_len]
+                        buf_start, buf_len = 0, live
+                        if buf_len + n > BUF_CAP:
+                            keep = BUF_CAP - n
+                            mv[:keep] = mv[buf_len - keep:buf_len]
+                            buf_len = keep
+                    buf[buf_len:buf_len + n] = chunk
+                    buf_len += n
+
+                frames, buf_start, buf_len = decode_weight_from_stream(
+                    buf, buf_start, buf_len
+                )
 
-                for actual_kg, seg, rev in frames:
+                if frames:
                     now = time.time()
+                    now_ns = time.monotonic_ns()
+
+                    # Fold the whole chunk's samples through the EMA in
+                    # locals *outside* the lock, then take the lock once for
+                    # the field writes and a single FSM step on the final
+                    # smoothed value. Intermediate transitions the
+                    # per-sample FSM could have seen are gated by hold
+                    # timers (0.3-3 s) anyway, far longer than one chunk.
+                    #
+                    # Reading smoothed_kg unlocked is fine: this thread is
+                    # its only writer besides _reset_state, and a racing
+                    # reset costs at most one stale smoothed sample.
+                    smoothed = ema_fold(
+                        [f[0] for f in frames], state.smoothed_kg
+                    )
+
+                    actual_kg, seg, rev = frames[-1]
+                    display = round_display(smoothed)
+
                     with lock:
                         state.last_raw_kg = actual_kg
                         state.last_segment = seg
                         state.last_segment_reversed = rev
                         state.updated = now
+                        state.smoothed_kg = smoothed
+                        state.display_kg = display
 
-                        # EMA smoothing
-                        if state.smoothed_kg is None:
-                            state.smoothed_kg = actual_kg
-                        else:
-                            state.smoothed_kg = (
-                                SMOOTH_ALPHA * actual_kg +
-                                (1.0 - SMOOTH_ALPHA) * state.smoothed_kg
-                            )
-
-                        # Display weight: real weight, rounded to nearest 0.5 kg
-                        state.display_kg = round_to_step_nearest(
-                            state.smoothed_kg, DISPLAY_STEP_KG
-                        )
+                        # Step game state machine
+                        step_state_machine_locked(now_ns)
+
+                        _publish_snapshot_locked()
 
-                        # Debug print of the decoded frame
-                        print(
+                    if DEBUG:
+                        LOG_Q.append(
                             f"PARSED FRAME: seg='{seg}' -> rev='{rev}' -> "
-                            f"actual={actual_kg:.3f} kg, display={state.display_kg:.1f} kg"
+                            f"actual={actual_kg:.3f} kg, display={display:.1f} kg\n"
                         )
 
-                        # Step game state machine
-                        step_state_machine_locked(now)
-
-            # periodic console status (every 0.5s)
-            now = time.time()
-            if now - last_log >= 0.5:
-                with lock:
-                    disp = state.display_kg
-                    base = state.baseline_display_kg
-                    phase = state.phase
-                    if disp is None:
-                        msg = "display: --.- kg"
-                    else:
-                        msg = f"display: {disp:6.1f} kg"
-
-                    if base is None:
-                        base_msg = "baseline: --.- kg"
-                    else:
-                        base_msg = f"baseline: {base:6.1f} kg"
-
-                    print(
-                        f"{msg} | {base_msg} | phase={phase:<16}",
-                        end="\r",
-                        flush=True,
-                    )
-                last_log = now
-
         except KeyboardInterrupt:
             stop_flag = True
         except Exception as e:
@@ -298,7 +575,42 @@ def reader_loop():
     print("\nSerial closed.")
 
 
-def step_state_machine_locked(now: float):
+def status_loop():
+    """
+    Console heartbeat at 2 Hz, on its own daemon thread.
+
+    Reads the published snapshot (no lock), so the reader loop never pays
+    for the status formatting or the stdout flush syscall.
+    """
+    while not stop_flag:
+        snap = _latest[0][0]
+        disp = snap.get("display_kg")
+        base = snap.get("baseline_display_kg")
+        phase = snap.get("phase", "WAITING")
+
+        msg = "display: --.- kg" if disp is None else f"display: {disp:6.1f} kg"
+        base_msg = "baseline: --.- kg" if base is None else f"baseline: {base:6.1f} kg"
+
+        print(
+            f"{msg} | {base_msg} | phase={phase:<16}",
+            end="\r",
+            flush=True,
+        )
+        time.sleep(0.5)
+
+
+# Hoisted bindings for the per-chunk wrapper below: one LOAD_GLOBAL each
+# instead of a module + attribute lookup chain on every call.
+_fsm_step               = fsm_core.step
+_EVENT_NONE             = fsm_core.EVENT_NONE
+_EVENT_ARMING_STARTED   = fsm_core.EVENT_ARMING_STARTED
+_EVENT_ARM_CANCELLED    = fsm_core.EVENT_ARM_CANCELLED
+_EVENT_ARMED            = fsm_core.EVENT_ARMED
+_EVENT_DROP             = fsm_core.EVENT_DROP
+_EVENT_RESTORE          = fsm_core.EVENT_RESTORE
+
+
+def step_state_machine_locked(now_ns: int):
     """
     Game state machine.
 
@@ -306,6 +618,10 @@ def step_state_machine_locked(now: float):
     - Baseline is 90% of arming actual (rounded).
     - Drop / restore use display_kg vs baseline_display_kg, in *display space*
       so what players see is exactly what the logic uses.
+
+    The numeric decisions live in fsm_core.step (numba-compiled when numba
+    is available); this wrapper translates GameState to/from the core's
+    scalar arguments and performs the side effects for the returned event.
     """
     actual = state.smoothed_kg
     disp   = state.display_kg
@@ -313,102 +629,78 @@ def step_state_machine_locked(now: float):
     if actual is None or disp is None:
         return
 
-    # ---- PHASE: WAITING / ARMING (arming based on actual kg) ----
-    if state.phase in ("WAITING", "ARMING") and not state.armed:
-        if actual >= MIN_TRIGGER_KG:
-            if state.phase == "WAITING":
-                state.phase = "ARMING"
-                state.arm_start = now
-                print(f"\n[ARMING] actual={actual:.2f} kg ≥ {MIN_TRIGGER_KG:.1f} kg")
-
-            if (now - state.arm_start) >= ARM_HOLD_S:
-                # ARM NOW
-                state.armed = True
-                state.phase = "TRAPPED"
-                state.arming_actual_kg = actual
-
-                # --- NEW RULE: baseline capped at 100 kg ---
-                baseline_actual = 1.0 * actual
-                baseline_actual = min(baseline_actual, 100.0)
-                state.baseline_display_kg = round_to_step_nearest(
-                    baseline_actual, DISPLAY_STEP_KG
-                )
- 
-                state.drop_start = 0.0
-                state.restore_start = 0.0
-
-                press_companion(EP_TRAPPED)
-                print(
-                    f"\n[ARMED] actual={actual:.2f} kg | baseline_display="
-                    f"{state.baseline_display_kg:.1f} kg (90% of arming actual)"
-                )
-        else:
-            if state.phase == "ARMING":
-                print("\n[ARMING CANCELLED] actual dropped below trigger.")
-            state.phase = "WAITING"
-            state.arm_start = 0.0
+    # Fast path: nobody anywhere near the scale. The common idle case
+    # (hours of ~0 kg while waiting to arm) skips the whole FSM; the 1 kg
+    # hysteresis keeps readings hovering at the trigger from flapping
+    # between the fast and full paths.
+    if (not state.armed
+            and state.phase == FsmState.WAITING
+            and actual < MIN_TRIGGER_KG - 1.0):
         return
 
-    # If we're here and not armed, nothing to do
-    if not state.armed or state.baseline_display_kg is None:
-        return
+    baseline = (
+        state.baseline_display_kg
+        if state.baseline_display_kg is not None else -1.0
+    )
 
-    baseline = state.baseline_display_kg
-    W = disp
-    B = baseline
-
-    # ---- PHASE: TRAPPED -> ESCAPE_ATTEMPT (drop) ----
-    if state.phase == "TRAPPED":
-        if W < B:
-            if state.drop_start == 0.0:
-                state.drop_start = now
-            if (now - state.drop_start) >= DROP_HOLD_S:
-                state.phase = "ESCAPE_ATTEMPT"
-                state.drop_start = 0.0
-                state.restore_start = 0.0
-                press_companion(EP_DROP)
-                print(
-                    f"\n[DROP] display {W:.2f} < baseline {B:.2f} "
-                    f"(held {DROP_HOLD_S:.2f}s) -> ESCAPE_ATTEMPT"
-                )
-        else:
-            state.drop_start = 0.0
-        return
+    (phase, armed, baseline, arm_start,
+     drop_start, restore_start, event) = _fsm_step(
+        int(state.phase), state.armed, actual, baseline,
+        state.arm_start, state.drop_start, state.restore_start,
+        now_ns, MIN_TRIGGER_KG, ARM_HOLD_NS, DROP_HOLD_NS, RESTORE_HOLD_NS,
+        disp, DISPLAY_STEP_KG,
+    )
 
-    # ---- PHASE: ESCAPE_ATTEMPT -> TRAPPED (restore) ----
-    if state.phase == "ESCAPE_ATTEMPT":
-        if W >= B:
-            if state.restore_start == 0.0:
-                state.restore_start = now
-            if (now - state.restore_start) >= RESTORE_HOLD_S:
-                prev_phase = state.phase
-                state.phase = "TRAPPED"
-                state.restore_start = 0.0
-                state.drop_start = 0.0
-                press_companion(EP_RESTORE)
-                print(
-                    f"\n[RESTORE] display {W:.2f} ≥ baseline {B:.2f} "
-                    f"(held {RESTORE_HOLD_S:.2f}s) -> TRAPPED"
-                )
-        else:
-            state.restore_start = 0.0
+    state.phase = FsmState(phase)
+    state.armed = bool(armed)
+    state.baseline_display_kg = baseline if baseline >= 0.0 else None
+    state.arm_start = arm_start
+    state.drop_start = drop_start
+    state.restore_start = restore_start
+
+    if event == _EVENT_NONE:
+        return
+    if event == _EVENT_ARMING_STARTED:
+        print(f"\n[ARMING] actual={actual:.2f} kg ≥ {MIN_TRIGGER_KG:.1f} kg")
+    elif event == _EVENT_ARM_CANCELLED:
+        print("\n[ARMING CANCELLED] actual dropped below trigger.")
+    elif event == _EVENT_ARMED:
+        state.arming_actual_kg = actual
+        press_companion(EP_TRAPPED)
+        print(
+            f"\n[ARMED] actual={actual:.2f} kg | baseline_display="
+            f"{state.baseline_display_kg:.1f} kg (90% of arming actual)"
+        )
+    elif event == _EVENT_DROP:
+        press_companion(EP_DROP)
+        print(
+            f"\n[DROP] display {disp:.2f} < baseline {baseline:.2f} "
+            f"(held {DROP_HOLD_S:.2f}s) -> ESCAPE_ATTEMPT"
+        )
+    elif event == _EVENT_RESTORE:
+        press_companion(EP_RESTORE)
+        print(
+            f"\n[RESTORE] display {disp:.2f} ≥ baseline {baseline:.2f} "
+            f"(held {RESTORE_HOLD_S:.2f}s) -> TRAPPED"
+        )
 
 
 def _reset_state():
     with lock:
         state.armed = False
-        state.phase = "WAITING"
+        state.phase = FsmState.WAITING
         state.last_raw_kg = None
         state.smoothed_kg = None
         state.display_kg = None
         state.baseline_display_kg = None
         state.arming_actual_kg = None
-        state.arm_start = 0.0
-        state.drop_start = 0.0
-        state.restore_start = 0.0
+        state.arm_start = 0
+        state.drop_start = 0
+        state.restore_start = 0
         state.updated = time.time()
         state.last_segment = ""
         state.last_segment_reversed = ""
+        _publish_snapshot_locked()
     print("\n[DISARM] state reset.")
 
 
@@ -471,11 +763,8 @@ function fmt1(x){
   return Number(x).toFixed(1);
 }
 
-async function tick(){
+function render(d){
   try{
-    const r = await fetch('/api/state',{cache:'no-store'});
-    const d = await r.json();
-
     // Live display
     document.getElementById('kg').textContent = fmt1(d.display_kg) + ' kg';
 
@@ -508,31 +797,70 @@ async function tick(){
       escape.classList.toggle('on',  currentlyBelow);
       escape.classList.toggle('flash', currentlyBelow);
     }
-  }catch(e){ /* ignore transient fetch errors */ }
+  }catch(e){ /* ignore transient render errors */ }
 }
-setInterval(tick, 250);
-tick();
+
+// Server pushes a frame only when the state actually changes; the browser
+// auto-reconnects if the stream drops.
+const es = new EventSource('/api/events');
+es.onmessage = (ev) => render(JSON.parse(ev.data));
 </script>
 """
 
+# The overlay page has no template variables, so Jinja adds nothing:
+# compress the static bytes once at import and serve them as-is.
+_HTML_GZ = gzip.compress(HTML.encode("utf-8"), 6)
+
+
 @app.route("/")
 def index():
-    return render_template_string(HTML)
+    return Response(
+        _HTML_GZ,
+        mimetype="text/html",
+        headers={"Content-Encoding": "gzip", "Cache-Control": "max-age=300"},
+    )
 
 @app.get("/api/state")
 def api_state():
-    with lock:
-        d = asdict(state)
-        d["now"] = time.time()
-        # Keep a config block so external tools can still introspect if needed.
-        d["config"] = dict(
-            MIN_TRIGGER_KG=MIN_TRIGGER_KG,
-            ARM_HOLD_S=ARM_HOLD_S,
-            DISPLAY_STEP_KG=DISPLAY_STEP_KG,
-            DROP_HOLD_S=DROP_HOLD_S,
-            RESTORE_HOLD_S=RESTORE_HOLD_S,
-        )
-    return jsonify(d)
+    # Lock-free: the serial thread swaps the whole (dict, bytes, seq, etag)
+    # tuple atomically; the bytes already contain everything (incl. the
+    # static config block) except the "now" timestamp.
+    _snap, body, _seq_, etag = _latest[0]
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status=304)
+    return Response(
+        body + repr(time.time()).encode() + b"}",
+        mimetype="application/json",
+        headers={"ETag": etag},
+    )
+
+@app.get("/api/events")
+def api_events():
+    """
+    Server-sent events: one frame per actual state change (plus a periodic
+    keepalive comment), replacing 4 req/s polling per overlay client.
+    """
+    def gen():
+        last_seq = -1
+        idle = 0
+        while True:
+            snap, _body, seq, _etag = _latest[0]
+            if seq != last_seq:
+                last_seq = seq
+                idle = 0
+                yield f"data: {orjson.dumps(snap).decode()}\n\n"
+            else:
+                idle += 1
+                if idle >= 60:  # ~15 s without a change
+                    idle = 0
+                    yield ": keepalive\n\n"
+            # Wake promptly on the next publish; the short timeout only
+            # bounds how stale a missed wakeup can be.
+            _state_changed.wait(timeout=0.25)
+            _state_changed.clear()
+
+    return Response(gen(), mimetype="text/event-stream")
+
 
 @app.route("/api/disarm", methods=["POST","GET"])
 def api_disarm():
@@ -549,17 +877,18 @@ def api_reset():
 def dev_arm(actual):
     with lock:
         baseline_actual = 0.90 * actual
-        baseline_display = round_to_step_nearest(baseline_actual, DISPLAY_STEP_KG)
+        baseline_display = round_display(baseline_actual)
 
         state.armed = True
-        state.phase = "TRAPPED"
+        state.phase = FsmState.TRAPPED
         state.arming_actual_kg     = actual
         state.baseline_display_kg  = baseline_display
         state.display_kg           = baseline_display
         state.smoothed_kg          = actual
         state.last_raw_kg          = actual
-        state.arm_start = state.drop_start = state.restore_start = 0.0
+        state.arm_start = state.drop_start = state.restore_start = 0
         state.updated = time.time()
+        _publish_snapshot_locked()
     return jsonify(
         ok=True, armed=True,
         arming_actual=actual,
@@ -572,13 +901,32 @@ def dev_disarm():
     return jsonify(ok=True, armed=False)
 
 def main():
+    # Longer GIL switch interval: the reader is mostly blocked in ser.read,
+    # so fewer forced switches means less thrash between it and Flask.
+    sys.setswitchinterval(0.02)
+
     t = threading.Thread(target=reader_loop, daemon=True)
     t.start()
+    threading.Thread(target=companion_worker, daemon=True).start()
+    threading.Thread(target=status_loop, daemon=True).start()
+    threading.Thread(target=logger_loop, daemon=True).start()
     print(
         f"HTTP ready at http://{LISTEN_HOST}:{LISTEN_PORT}  "
         f"(/, /api/state, /api/disarm, /api/dev/arm/<kg>)"
     )
-    app.run(host=LISTEN_HOST, port=LISTEN_PORT, debug=False, threaded=True)
+    try:
+        # Production WSGI server: pre-spawned thread pool + proper HTTP
+        # keepalive, so 4 Hz polling from several overlay browsers doesn't
+        # pay Werkzeug's per-connection setup.
+        from waitress import serve
+        serve(app, host=LISTEN_HOST, port=LISTEN_PORT,
+              threads=8, connection_limit=64)
+    except ImportError:
+        print("[WARN] waitress not installed; falling back to the Flask dev server")
+        # silence the per-request access log: it's a stderr write per poll
+        # that fights the reader thread's console output
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        app.run(host=LISTEN_HOST, port=LISTEN_PORT, debug=False, threaded=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,140 @@
+"""
+Numerical core of the "Baby Trapped" game state machine.
+
+The per-sample work (threshold comparisons, timer bookkeeping, baseline
+rounding) is pure scalar arithmetic, so it lives here in a form numba can
+compile. When numba is installed the step function is JIT-compiled with
+cache=True (so the compile cost is paid once per machine, not per run);
+without numba it runs as plain Python with identical semantics.
+
+Phases and events are small int codes so the jitted code never touches
+Python strings; the caller translates back for display/HTTP.
+"""
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba is optional; fall back to plain Python
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        def wrap(fn):
+            return fn
+        if args and callable(args[0]):
+            return args[0]
+        return wrap
+
+# Phase codes (mirror the phase strings in the main script)
+WAITING = 0
+ARMING = 1
+TRAPPED = 2
+ESCAPE_ATTEMPT = 3
+
+# Event codes returned by step(); the caller does the side effects
+# (Companion presses, prints) so the jitted core stays side-effect free.
+EVENT_NONE = 0
+EVENT_ARMING_STARTED = 1
+EVENT_ARM_CANCELLED = 2
+EVENT_ARMED = 3
+EVENT_DROP = 4
+EVENT_RESTORE = 5
+
+# Baseline cap applied at arming (ACTUAL kg)
+BASELINE_CAP_KG = 100.0
+
+
+@njit(cache=True, fastmath=True)
+def ema(prev: float, value: float, alpha: float) -> float:
+    return alpha * value + (1.0 - alpha) * prev
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def ema_batch(arr, prev: float, alpha: float) -> float:
+    """Fold a whole float64 array through the EMA in one C-speed pass.
+    nogil=True lets Flask handlers run while a burst is processed."""
+    s = prev
+    one_minus = 1.0 - alpha
+    for v in arr:
+        s = alpha * v + one_minus * s
+    return s
+
+
+@njit(cache=True, fastmath=True)
+def round_to_step(x: float, step: float) -> float:
+    return round(x / step) * step
+
+
+@njit(cache=True, fastmath=True)
+def step(phase, armed, actual, baseline, arm_start, drop_start, restore_start,
+         now, min_trigger, arm_hold, drop_hold, restore_hold, disp, step_kg):
+    """
+    Advance the FSM one tick.
+
+    'baseline' uses -1.0 as the "not set" sentinel (weights are >= 0).
+    'now', the *_start timers, and the hold thresholds are integer
+    time.monotonic_ns ticks (0 = timer not running), so the hold checks
+    are integer compares immune to wall-clock steps.
+    Returns (phase, armed, baseline, arm_start, drop_start, restore_start,
+    event).
+    """
+    event = EVENT_NONE
+
+    # ---- PHASE: WAITING / ARMING (arming based on actual kg) ----
+    if (phase == WAITING or phase == ARMING) and not armed:
+        if actual >= min_trigger:
+            if phase == WAITING:
+                phase = ARMING
+                arm_start = now
+                event = EVENT_ARMING_STARTED
+
+            if (now - arm_start) >= arm_hold:
+                # ARM NOW
+                armed = True
+                phase = TRAPPED
+
+                # --- NEW RULE: baseline capped at 100 kg ---
+                baseline_actual = min(1.0 * actual, BASELINE_CAP_KG)
+                baseline = round_to_step(baseline_actual, step_kg)
+
+                drop_start = 0
+                restore_start = 0
+                event = EVENT_ARMED
+        else:
+            if phase == ARMING:
+                event = EVENT_ARM_CANCELLED
+            phase = WAITING
+            arm_start = 0
+        return phase, armed, baseline, arm_start, drop_start, restore_start, event
+
+    # If we're here and not armed, nothing to do
+    if not armed or baseline < 0.0:
+        return phase, armed, baseline, arm_start, drop_start, restore_start, event
+
+    # ---- PHASE: TRAPPED -> ESCAPE_ATTEMPT (drop) ----
+    if phase == TRAPPED:
+        if disp < baseline:
+            if drop_start == 0:
+                drop_start = now
+            if (now - drop_start) >= drop_hold:
+                phase = ESCAPE_ATTEMPT
+                drop_start = 0
+                restore_start = 0
+                event = EVENT_DROP
+        else:
+            drop_start = 0
+        return phase, armed, baseline, arm_start, drop_start, restore_start, event
+
+    # ---- PHASE: ESCAPE_ATTEMPT -> TRAPPED (restore) ----
+    if phase == ESCAPE_ATTEMPT:
+        if disp >= baseline:
+            if restore_start == 0:
+                restore_start = now
+            if (now - restore_start) >= restore_hold:
+                phase = TRAPPED
+                restore_start = 0
+                drop_start = 0
+                event = EVENT_RESTORE
+        else:
+            restore_start = 0
+
+    return phase, armed, baseline, arm_start, drop_start, restore_start, event
@@ -1,537 +1,1033 @@
-# serial_scale_game_overlay.py
-# Overlay + game logic for “Baby Trapped” using direct serial from scales.
-# Display shown = round_nearest(actual * 0.90, 0.5 kg).
-# Arming: actual ≥ 35.0 kg for 3.0 s (smoothed).
-# Hidden thresholds use capped arming actual = min(arming_actual, 112.0):
-#   DROP if actual < 0.90 * capped_arming_actual for 0.40 s
-#   RESTORE if actual ≥ 0.90 * capped_arming_actual for 0.30 s
-# Baseline shown on overlay at arming:
-#   if arming_actual > 112.0 -> 100.0 kg
-#   else -> round_nearest(arming_actual * 0.90, 0.5 kg)
-# No rapid-fall logic; just the hold-downs.
-
-import math
-import re
-import sys
-import time
-import threading
-import statistics
-from dataclasses import dataclass, asdict
-from typing import Optional, List
-
-import requests
-import serial
-from flask import Flask, jsonify, render_template_string
-
-# ===================== HARD-CODED CONFIG =====================
-
-COM_PORT = r"COM9"          # your USB adapter port
-BAUD = 9600
-USE_7E1 = False             # True => 7E1, False => 8N1
-
-# Arming thresholds (ACTUAL kg)
-MIN_TRIGGER_KG = 35.0
-STABLE_SECONDS = 3.0
-
-# Display factor & rounding
-DISPLAY_FACTOR = 0.90
-DISPLAY_STEP_KG = 0.5
-
-# Escape/Restore thresholds (ACTUAL)
-DROP_FACTOR = 0.90
-RESTORE_FACTOR = 0.90
-
-# Debounce / hold-times
-DROP_HOLDDOWN_S = 0.40
-RESTORE_HOLDDOWN_S = 0.30
-
-# Smoothing on ACTUAL
-SMOOTH_WINDOW = 4
-
-# Companion (press endpoints)
-COMPANION_HOST = "192.168.2.202"
-COMPANION_PORT = 8000
-EP_DROP = "44/0/1"
-EP_RESTORE = "44/0/2"
-EP_TRAPPED = "44/0/3"
-COMPANION_TIMEOUT = 1.0
-
-# Flask server
-LISTEN_HOST = "0.0.0.0"
-LISTEN_PORT = 8420
-
-# ============================================================
-
-# ----- Serial config -----
-if USE_7E1:
-    BYTESIZE = serial.SEVENBITS
-    PARITY = serial.PARITY_EVEN
-    STOPBITS = serial.STOPBITS_ONE
-else:
-    BYTESIZE = serial.EIGHTBITS
-    PARITY = serial.PARITY_NONE
-    STOPBITS = serial.STOPBITS_ONE
-
-# Pattern for scale lines like '=6.54000'
-PAT = re.compile(r'=\s*([0-9.]+)')
-
-
-def round_to_step_nearest(x: float, step: float) -> float:
-    return round(x / step) * step
-
-
-def display_round_nearest(actual_kg: float) -> float:
-    return round_to_step_nearest(actual_kg * DISPLAY_FACTOR, DISPLAY_STEP_KG)
-
-
-def reverse_weight_string(raw: str) -> Optional[float]:
-    s = raw[::-1]  # incoming reversed digits
-    try:
-        return float(s)
-    except ValueError:
-        return None
-
-
-def press_companion(endpoint: str) -> bool:
-    url = f"http://{COMPANION_HOST}:{COMPANION_PORT}/api/location/{endpoint}/press"
-    try:
-        requests.post(url, timeout=COMPANION_TIMEOUT)
-        return True
-    except Exception:
-        return False
-
-
-@dataclass
-class GameState:
-    armed: bool = False
-
-    # ACTUAL readings
-    last_seen_kg: Optional[float] = None
-    smoothed_kg: Optional[float] = None
-
-    # DISPLAY numbers
-    display_kg: Optional[float] = None
-    baseline_display_kg: Optional[float] = None
-
-    # Hidden detection baselines (ACTUAL-based)
-    arming_actual_kg: Optional[float] = None
-    capped_arm_actual_kg: Optional[float] = None
-    drop_limit_actual_kg: Optional[float] = None
-    restore_limit_actual_kg: Optional[float] = None
-
-    # timers & flags
-    is_below: bool = False
-    above_start: float = 0.0
-    below_start: float = 0.0
-    above_limit_start: float = 0.0
-    updated: float = 0.0
-    last_ascii: str = ""
-
-
-state = GameState()
-history: List[float] = []
-lock = threading.Lock()
-stop_flag = False
-
-
-def reader_loop():
-    global stop_flag
-
-    try:
-        ser = serial.Serial(
-            port=COM_PORT,
-            baudrate=BAUD,
-            bytesize=BYTESIZE,
-            parity=PARITY,
-            stopbits=STOPBITS,
-            timeout=0.2,
-            rtscts=False,
-            dsrdtr=False,
-            xonxoff=False,
-        )
-    except Exception as e:
-        print(f"\n[!] ERROR opening {COM_PORT}: {e}")
-        sys.exit(1)
-
-    print(f"\nConnected: {COM_PORT} @ {BAUD} {'7E1' if USE_7E1 else '8N1'}")
-    print(f"Arming when ACTUAL ≥ {MIN_TRIGGER_KG:.1f} kg for {STABLE_SECONDS:.1f}s")
-    print(f"Display = round_nearest(actual × {DISPLAY_FACTOR:.2f}, {DISPLAY_STEP_KG:.1f}kg)")
-    print(f"DROP if ACTUAL < {int(DROP_FACTOR*100)}% of capped arming actual (hold {DROP_HOLDDOWN_S:.2f}s)")
-    print(f"RESTORE if ACTUAL ≥ {int(RESTORE_FACTOR*100)}% of capped arming actual (hold {RESTORE_HOLDDOWN_S:.2f}s)")
-    print(f"Overlay: http://{LISTEN_HOST}:{LISTEN_PORT}/ API endpoints: /api/state /api/disarm /api/dev/arm/<kg>\n")
-
-    buf = ""
-    last_log = 0.0
-
-    while not stop_flag:
-        try:
-            chunk = ser.read(1024)
-            if chunk:
-                try:
-                    text = chunk.decode("utf-8", errors="ignore")
-                except Exception:
-                    text = "".join(chr(b) if 32 <= b <= 126 else "" for b in chunk)
-
-                buf += text
-                matches = PAT.findall(buf)
-
-                if len(buf) > 256:
-                    buf = buf[-64:]
-
-                if matches:
-                    for raw in matches[-3:]:
-                        actual_kg = reverse_weight_string(raw)
-                        if actual_kg is None:
-                            continue
-
-                        with lock:
-                            state.last_seen_kg = actual_kg
-                            state.last_ascii = raw
-
-                            history.append(actual_kg)
-                            if len(history) > max(1, SMOOTH_WINDOW):
-                                del history[:-SMOOTH_WINDOW]
-
-                            try:
-                                state.smoothed_kg = statistics.median(history)
-                            except statistics.StatisticsError:
-                                state.smoothed_kg = actual_kg
-
-                            state.display_kg = display_round_nearest(state.smoothed_kg)
-                            state.updated = time.time()
-
-                            step_state_machine_locked()
-
-            # periodic console status
-            now = time.time()
-            if now - last_log >= 0.5:
-                with lock:
-                    disp = state.display_kg
-                    if disp is not None:
-                        if not state.armed:
-                            print(f"display {disp:7.1f} kg | waiting ACTUAL ≥ {MIN_TRIGGER_KG:.1f} for {STABLE_SECONDS:.1f}s",
-                                  end="\r")
-                        else:
-                            side = "below" if state.is_below else "above"
-                            drop_l = state.drop_limit_actual_kg or float("nan")
-                            rest_l = state.restore_limit_actual_kg or float("nan")
-                            base_d = state.baseline_display_kg if state.baseline_display_kg is not None else float("nan")
-
-                            print(
-                                f"display {disp:7.1f} | baseline {base_d:7.1f} | "
-                                f"ACTUAL drop<{drop_l:6.1f} / restore≥{rest_l:6.1f} ({side})",
-                                end="\r"
-                            )
-                last_log = now
-
-        except KeyboardInterrupt:
-            stop_flag = True
-        except Exception as e:
-            print(f"\n[!] Serial read error: {e}")
-            time.sleep(0.2)
-
-    try:
-        ser.close()
-    except Exception:
-        pass
-    print("\nSerial closed.")
-
-
-def step_state_machine_locked():
-    now = time.time()
-    actual = state.smoothed_kg
-    disp = state.display_kg
-
-    if actual is None or disp is None:
-        return
-
-    # ----- Not armed yet -----
-    if not state.armed:
-        if actual >= MIN_TRIGGER_KG:
-            if state.above_start == 0.0:
-                state.above_start = now
-
-            if (now - state.above_start) >= STABLE_SECONDS:
-                state.armed = True
-                state.arming_actual_kg = actual
-                state.capped_arm_actual_kg = min(actual, 112.0)
-                state.drop_limit_actual_kg = state.capped_arm_actual_kg * DROP_FACTOR
-                state.restore_limit_actual_kg = state.capped_arm_actual_kg * RESTORE_FACTOR
-
-                if actual > 112.0:
-                    state.baseline_display_kg = 100.0
-                else:
-                    state.baseline_display_kg = display_round_nearest(actual)
-
-                state.is_below = False
-                state.below_start = 0.0
-                state.above_limit_start = 0.0
-
-                press_companion(EP_TRAPPED)
-
-                print(
-                    f"\n[ARMED] ACTUAL={actual:.2f} shown_at_arm={display_round_nearest(actual):.2f} "
-                    f"baseline_display={state.baseline_display_kg:.2f} "
-                    f"capForThresh={state.capped_arm_actual_kg:.2f} "
-                    f"drop<{state.drop_limit_actual_kg:.2f} restore≥{state.restore_limit_actual_kg:.2f}"
-                )
-        else:
-            state.above_start = 0.0
-
-        return
-
-    # ----- Armed: enforce thresholds -----
-    drop_limit = state.drop_limit_actual_kg
-    restore_limit = state.restore_limit_actual_kg
-
-    if drop_limit is None or restore_limit is None:
-        return
-
-    if state.is_below:
-        # Look for RESTORE
-        if actual >= restore_limit:
-            if state.above_limit_start == 0.0:
-                state.above_limit_start = now
-
-            if (now - state.above_limit_start) >= RESTORE_HOLDDOWN_S:
-                press_companion(EP_RESTORE)
-                state.is_below = False
-                state.below_start = 0.0
-                state.above_limit_start = 0.0
-                print(f"\n[RESTORE] actual {actual:.2f} ≥ {restore_limit:.2f}")
-        else:
-            state.above_limit_start = 0.0
-
-    else:
-        # Look for DROP
-        if actual < drop_limit:
-            if state.below_start == 0.0:
-                state.below_start = now
-
-            if (now - state.below_start) >= DROP_HOLDDOWN_S:
-                press_companion(EP_DROP)
-                state.is_below = True
-                state.below_start = 0.0
-                state.above_limit_start = 0.0
-                print(f"\n[DROP] actual {actual:.2f} < {drop_limit:.2f}")
-        else:
-            state.below_start = 0.0
-
-
-def _reset_state():
-    with lock:
-        state.armed = False
-        state.last_seen_kg = None
-        state.smoothed_kg = None
-        state.display_kg = None
-        state.baseline_display_kg = None
-        state.arming_actual_kg = None
-        state.capped_arm_actual_kg = None
-        state.drop_limit_actual_kg = None
-        state.restore_limit_actual_kg = None
-
-        state.is_below = False
-        state.above_start = 0.0
-        state.below_start = 0.0
-        state.above_limit_start = 0.0
-
-        state.updated = time.time()
-        state.last_ascii = ""
-        history.clear()
-
-    print("\n[DISARM] state reset.")
-
-
-# =================== Flask (HTML + API) ======================
-
-app = Flask(__name__)
-
-HTML = """<!doctype html>
-<meta charset="utf-8">
-<title>Weight Game</title>
-<style>
-:root{color-scheme:dark}
-html,body{margin:0;height:100%;background:transparent;color:#eee;font-family:system-ui,-apple-system,Segoe UI,Roboto,Arial,sans-serif}
-.wrap{display:flex;flex-direction:column;justify-content:center;align-items:center;height:100%;text-align:center}
-.big{font-size:12vmin;font-weight:800;letter-spacing:.02em;text-shadow:0 0 10px rgba(0,0,0,.35)}
-.row{display:flex;gap:1.2rem;margin-top:1.0rem;flex-wrap:wrap;justify-content:center}
-.card{min-width:20ch;padding:.6rem 1rem;border:1px solid #333;border-radius:12px;background:rgba(0,0,0,.35)}
-.label{font-size:2.2vmin;opacity:.85}
-.value{font-size:5.6vmin;font-weight:700;margin-top:.2rem}
-.banner{font-size:4.2vmin;font-weight:800;letter-spacing:.04em;margin:1.2rem 0 .6rem;padding:.4rem 1rem;border-radius:12px;border:2px solid #333;background:rgba(0,0,0,.45);display:none}
-.banner.on{display:inline-block}
-.banner.trapped{border-color:#244;color:#7bd3ff;}
-.banner.escape{border-color:#550;color:#ff5f58;}
-@keyframes pulse {0%{opacity:1}50%{opacity:.7;filter:drop-shadow(0 0 10px #d00)}100%{opacity:1;filter:none}}
-.escape.flash {animation: pulse .9s ease-in-out infinite;}
-.note{margin-top:1.0rem;font-size:2.8vmin;color:#ddd;max-width:70vw;text-align:center;line-height:1.2;display:none}
-.note.on{display:block}
-.twolines{white-space:pre-line}
-</style>
-
-<div class="wrap">
-  <div class="big" id="kg">--.- kg</div>
-
-  <div id="bannerTrapped" class="banner trapped">BABY TRAPPED!</div>
-  <div id="bannerEscape" class="banner escape">BABY TRYING TO ESCAPE</div>
-
-  <div class="row" id="after" style="display:none">
-    <div class="card">
-      <div class="label">BASELINE</div>
-      <div id="baseline" class="value">--.- kg</div>
-    </div>
-  </div>
-
-  <div id="msg" class="note twolines">
-    If the display weight drops below the baseline, all doors will lock until the weight is restored.
-  </div>
-</div>
-
-<script>
-let lastArmed = false;
-
-function fmt1(x){
-  return (x!==null&&x!==undefined) ? Number(x).toFixed(1) : "--.-";
-}
-
-async function tick(){
-  try{
-    const r = await fetch('/api/state',{cache:'no-store'});
-    const d = await r.json();
-
-    document.getElementById('kg').textContent = fmt1(d.display_kg) + ' kg';
-
-    const armed = !!d.armed;
-    const trapped = document.getElementById('bannerTrapped');
-    const escape = document.getElementById('bannerEscape');
-    const after = document.getElementById('after');
-    const msg = document.getElementById('msg');
-
-    if (armed && !lastArmed) {
-        after.style.display = 'flex';
-        msg.classList.add('on');
-    }
-    if (!armed && lastArmed) {
-        after.style.display = 'none';
-        msg.classList.remove('on');
-        trapped.classList.remove('on');
-        escape.classList.remove('on','flash');
-        document.getElementById('baseline').textContent = "--.- kg";
-    }
-    lastArmed = armed;
-
-    if (armed){
-      document.getElementById('baseline').textContent = fmt1(d.baseline_display_kg) + ' kg';
-
-      const currentlyBelow = (d.is_below === true) || (d.below_start > 0);
-
-      trapped.classList.toggle('on', !currentlyBelow);
-      escape.classList.toggle('on', currentlyBelow);
-      escape.classList.toggle('flash', currentlyBelow);
-    }
-
-  }catch(e){ }
-}
-
-setInterval(tick, 250);
-tick();
-</script>
-"""
-
-
-@app.route("/")
-def index():
-    return render_template_string(HTML)
-
-
-@app.get("/api/state")
-def api_state():
-    with lock:
-        d = asdict(state)
-        d["now"] = time.time()
-        d["config"] = dict(
-            MIN_TRIGGER_KG=MIN_TRIGGER_KG,
-            STABLE_SECONDS=STABLE_SECONDS,
-            DISPLAY_FACTOR=DISPLAY_FACTOR,
-            DISPLAY_STEP_KG=DISPLAY_STEP_KG,
-            DROP_FACTOR=DROP_FACTOR,
-            RESTORE_FACTOR=RESTORE_FACTOR,
-            DROP_HOLDDOWN_S=DROP_HOLDDOWN_S,
-            RESTORE_HOLDDOWN_S=RESTORE_HOLDDOWN_S,
-            SMOOTH_WINDOW=SMOOTH_WINDOW,
-            EP_DROP=EP_DROP,
-            EP_RESTORE=EP_RESTORE,
-            EP_TRAPPED=EP_TRAPPED,
-        )
-        return jsonify(d)
-
-
-@app.route("/api/disarm", methods=["POST", "GET"])
-def api_disarm():
-    _reset_state()
-    return jsonify(ok=True, msg="disarmed/reset")
-
-
-@app.route("/api/reset", methods=["POST", "GET"])
-def api_reset():
-    _reset_state()
-    return jsonify(ok=True, msg="reset")
-
-
-# ====== DEV HELPERS ======
-
-@app.route("/api/dev/arm/<float:actual>", methods=["POST","GET"])
-def dev_arm(actual):
-    with lock:
-        capped = min(actual, 112.0)
-        drop = capped * DROP_FACTOR
-        rest = capped * RESTORE_FACTOR
-
-        if actual > 112.0:
-            baseline_display = 100.0
-        else:
-            baseline_display = round(
-                round((actual * DISPLAY_FACTOR) / DISPLAY_STEP_KG) * DISPLAY_STEP_KG, 2
-            )
-
-        state.armed = True
-        state.arming_actual_kg = actual
-        state.capped_arm_actual_kg = capped
-        state.drop_limit_actual_kg = drop
-        state.restore_limit_actual_kg= rest
-
-        state.baseline_display_kg = baseline_display
-        state.display_kg = baseline_display
-
-        state.is_below = False
-        state.above_start = state.below_start = state.above_limit_start = 0.0
-        state.updated = time.time()
-
-        return jsonify(
-            ok=True,
-            armed=True,
-            arming_actual=actual,
-            baseline_display_kg=baseline_display,
-            drop_limit_actual_kg=drop,
-            restore_limit_actual_kg=rest
-        )
-
-
-@app.route("/api/dev/disarm", methods=["POST","GET"])
-def dev_disarm():
-    _reset_state()
-    return jsonify(ok=True, armed=False)
-
-
-def main():
-    t = threading.Thread(target=reader_loop, daemon=True)
-    t.start()
-
-    print(f"HTTP ready at http://{LISTEN_HOST}:{LISTEN_PORT} "
-          f"(/, /api/state, /api/disarm, /api/dev/arm/<kg>)")
-
-    app.run(host=LISTEN_HOST, port=LISTEN_PORT, debug=False, threaded=True)
-
-
-if __name__ == "__main__":
-    main()
+# serial_scale_game_overlay.py
+# Overlay + game logic for “Baby Trapped” using direct serial from scales.
+# Display shown = round_nearest(actual * 0.90, 0.5 kg).
+# Arming: actual ≥ 35.0 kg for 3.0 s (smoothed).
+# Hidden thresholds use capped arming actual = min(arming_actual, 112.0):
+#   DROP if actual < 0.90 * capped_arming_actual for 0.40 s
+#   RESTORE if actual ≥ 0.90 * capped_arming_actual for 0.30 s
+# Baseline shown on overlay at arming:
+#   if arming_actual > 112.0 -> 100.0 kg
+#   else -> round_nearest(arming_actual * 0.90, 0.5 kg)
+# No rapid-fall logic; just the hold-downs.
+
+import collections
+import hashlib
+import heapq
+import math
+import os
+import queue
+import re
+import selectors
+import sys
+import time
+import threading
+from dataclasses import dataclass, fields
+from typing import List, Optional
+
+import orjson
+import requests
+import serial
+from flask import Flask, Response, request, stream_with_context
+from requests.adapters import HTTPAdapter
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only the wide-window median uses it
+    np = None
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to plain Python
+    def njit(*args, **kwargs):
+        def wrap(fn):
+            return fn
+        if args and callable(args[0]):
+            return args[0]
+        return wrap
+
+# ===================== HARD-CODED CONFIG =====================
+
+COM_PORT = r"COM9"          # your USB adapter port
+BAUD = 9600
+USE_7E1 = False             # True => 7E1, False => 8N1
+
+# Arming thresholds (ACTUAL kg)
+MIN_TRIGGER_KG = 35.0
+STABLE_SECONDS = 3.0
+
+# Display factor & rounding
+DISPLAY_FACTOR = 0.90
+DISPLAY_STEP_KG = 0.5
+
+# Escape/Restore thresholds (ACTUAL)
+DROP_FACTOR = 0.90
+RESTORE_FACTOR = 0.90
+
+# Debounce / hold-times
+DROP_HOLDDOWN_S = 0.40
+RESTORE_HOLDDOWN_S = 0.30
+
+# Smoothing on ACTUAL. "median" is the validated default; "ema" is a
+# single multiply-add per sample but lets one-sample spikes bleed into the
+# thresholds, so switch only after checking against real scale noise.
+SMOOTH_WINDOW = 4
+SMOOTH_MODE = "median"      # "median" or "ema"
+EMA_ALPHA = 0.4
+
+# Companion (press endpoints)
+COMPANION_HOST = "192.168.2.202"
+COMPANION_PORT = 8000
+EP_DROP = "44/0/1"
+EP_RESTORE = "44/0/2"
+EP_TRAPPED = "44/0/3"
+COMPANION_TIMEOUT = 1.0
+
+# Flask server
+LISTEN_HOST = "0.0.0.0"
+LISTEN_PORT = 8420
+
+# ============================================================
+
+# ----- Serial config -----
+if USE_7E1:
+    BYTESIZE = serial.SEVENBITS
+    PARITY = serial.PARITY_EVEN
+    STOPBITS = serial.STOPBITS_ONE
+else:
+    BYTESIZE = serial.EIGHTBITS
+    PARITY = serial.PARITY_NONE
+    STOPBITS = serial.STOPBITS_ONE
+
+# Pattern for scale lines like '=6.54000'. Bytes pattern: we scan the raw
+# serial buffer directly, no utf-8 decode per chunk. The shape requires
+# digits around at most one dot, so malformed runs ('..', '1.2.3') are
+# rejected inside the regex engine instead of reaching the parser.
+PAT = re.compile(rb'=\s*(\d+(?:\.\d+)?)')
+
+# Parse-buffer sizing: fixed capacity, compact when this much is consumed
+BUF_CAP = 4096
+COMPACT_AT = 2048
+
+
+def round_to_step_nearest(x: float, step: float) -> float:
+    return round(x / step) * step
+
+
+# Factor and step folded into one multiplier; the division is paid at import
+_DISPLAY_MUL = DISPLAY_FACTOR / DISPLAY_STEP_KG
+
+
+def display_round_nearest(actual_kg: float) -> float:
+    return round(actual_kg * _DISPLAY_MUL) * DISPLAY_STEP_KG
+
+
+def parse_rev(b: bytes) -> Optional[float]:
+    """Parse the reversed-digit wire form without the b[::-1] slice or
+    float() - one pass of integer math over the bytes, back to front."""
+    n = 0
+    frac = 0
+    scale = 1
+    seen_dot = False
+    have_digit = False
+    for c in reversed(b):  # iterating bytes yields ints; no copy made
+        if 48 <= c <= 57:  # '0'..'9'
+            if seen_dot:
+                frac = frac * 10 + (c - 48)
+                scale *= 10
+            else:
+                n = n * 10 + (c - 48)
+            have_digit = True
+        elif c == 46 and not seen_dot:  # '.'
+            seen_dot = True
+        else:
+            return None
+    if not have_digit:
+        return None
+    return n + frac / scale if seen_dot else float(n)
+
+
+# One keep-alive connection to the companion: presses reuse the TCP socket
+# instead of paying connect/close per event. max_retries=0 keeps a failed
+# press from stacking delays behind the next one.
+SESSION = requests.Session()
+SESSION.headers.update({"Connection": "keep-alive"})
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4,
+                                     max_retries=0))
+
+
+def press_companion(endpoint: str) -> bool:
+    url = f"http://{COMPANION_HOST}:{COMPANION_PORT}/api/location/{endpoint}/press"
+    try:
+        SESSION.post(url, timeout=COMPANION_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+
+# Presses are queued here and sent by a dedicated worker thread, so a slow
+# companion host never blocks the reader thread (which holds the lock when
+# transitions fire).
+press_q: queue.Queue = queue.Queue()
+
+
+def companion_worker():
+    while True:
+        press_companion(press_q.get())
+
+
+class StreamingMedian:
+    """
+    Median over a sliding window, maintained incrementally.
+
+    statistics.median() re-sorted (and re-allocated) the whole window on
+    every sample. Here two heaps hold the lower half (max-heap 'lo',
+    stored negated) and upper half (min-heap 'hi'); samples falling out of
+    the window are marked stale and lazily discarded when they surface at
+    a heap top. Each push is O(log w) with no sort and no list rebuild.
+    """
+
+    def __init__(self, window: int):
+        self.window = max(1, window)
+        self.clear()
+
+    def clear(self):
+        self._order = collections.deque()   # insertion order, for eviction
+        self._lo: List[float] = []          # max-heap of negated values
+        self._hi: List[float] = []          # min-heap
+        self._stale = collections.Counter() # value -> pending lazy deletes
+        self._lo_live = 0                   # live (non-stale) counts
+        self._hi_live = 0
+
+    def _prune_lo(self):
+        while self._lo and self._stale[-self._lo[0]] > 0:
+            self._stale[-self._lo[0]] -= 1
+            heapq.heappop(self._lo)
+
+    def _prune_hi(self):
+        while self._hi and self._stale[self._hi[0]] > 0:
+            self._stale[self._hi[0]] -= 1
+            heapq.heappop(self._hi)
+
+    def push(self, x: float) -> float:
+        """Insert a sample, evict the oldest if the window is full, and
+        return the current median."""
+        if len(self._order) == self.window:
+            old = self._order.popleft()
+            # classify against the live lo-top *before* marking stale, so
+            # the bucket counts stay consistent
+            self._prune_lo()
+            if self._lo and old <= -self._lo[0]:
+                self._lo_live -= 1
+            else:
+                self._hi_live -= 1
+            self._stale[old] += 1
+        self._order.append(x)
+
+        self._prune_lo()
+        if self._lo and x <= -self._lo[0]:
+            heapq.heappush(self._lo, -x)
+            self._lo_live += 1
+        else:
+            heapq.heappush(self._hi, x)
+            self._hi_live += 1
+
+        # Rebalance so lo holds the extra element for odd counts
+        if self._lo_live > self._hi_live + 1:
+            self._prune_lo()
+            heapq.heappush(self._hi, -heapq.heappop(self._lo))
+            self._lo_live -= 1
+            self._hi_live += 1
+        elif self._hi_live > self._lo_live:
+            self._prune_hi()
+            heapq.heappush(self._lo, -heapq.heappop(self._hi))
+            self._hi_live -= 1
+            self._lo_live += 1
+
+        self._prune_lo()
+        self._prune_hi()
+        if (self._lo_live + self._hi_live) & 1:
+            return -self._lo[0]
+        return (-self._lo[0] + self._hi[0]) / 2.0
+
+
+class Median4:
+    """
+    Median specialized for the fixed SMOOTH_WINDOW == 4 case.
+
+    The window lives in a 4-slot ring (index wraps with '& 3') and the
+    median of four is the mean of the two middle elements, obtained from a
+    5-comparator min/max network - constant-shape code with no heaps, no
+    container maintenance, and no allocations per sample. Warmup (fewer
+    than 4 samples) returns the true median of what's there, matching
+    StreamingMedian.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._h = [0.0, 0.0, 0.0, 0.0]
+        self._i = 0
+        self._n = 0
+
+    def push(self, x: float) -> float:
+        h = self._h
+        h[self._i] = x
+        self._i = (self._i + 1) & 3
+        if self._n < 4:
+            self._n += 1
+        n = self._n
+
+        if n == 4:
+            a, b, c, d = h
+            mid1 = max(min(a, b), min(c, d))
+            mid2 = min(max(a, b), max(c, d))
+            return (mid1 + mid2) * 0.5
+        # warmup: the first pushes fill slots 0..n-1 in order
+        if n == 1:
+            return h[0]
+        if n == 2:
+            return (h[0] + h[1]) * 0.5
+        a, b, c = h[0], h[1], h[2]
+        return max(min(a, b), min(max(a, b), c))
+
+
+class PartitionMedian:
+    """
+    Median for wide windows via a numpy ring plus np.partition.
+
+    For windows in the dozens, one C-level partial sort per sample beats
+    the two-heap bookkeeping of StreamingMedian; below that the constant
+    factors favour the heaps, so this is only selected for
+    SMOOTH_WINDOW >= 16 (and only when numpy is importable).
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._buf = np.empty(window, dtype=np.float64)
+        self._idx = 0
+        self._count = 0
+
+    def clear(self):
+        self._idx = 0
+        self._count = 0
+
+    def push(self, x: float) -> float:
+        self._buf[self._idx] = x
+        self._idx = (self._idx + 1) % self.window
+        if self._count < self.window:
+            self._count += 1
+        n = self._count
+        live = self._buf[:n]
+        k = n >> 1
+        if n & 1:
+            return float(np.partition(live, k)[k])
+        part = np.partition(live, (k - 1, k))
+        return (part[k - 1] + part[k]) / 2.0
+
+
+class Ewma:
+    """Exponentially weighted mean: the cheapest smoother there is, one
+    multiply-add per sample with no window at all. Offered behind
+    SMOOTH_MODE because unlike the median it does not fully reject a
+    single bad sample - it attenuates it."""
+
+    def __init__(self, alpha: float):
+        self._alpha = alpha
+        self._s: Optional[float] = None
+
+    def clear(self):
+        self._s = None
+
+    def push(self, x: float) -> float:
+        s = self._s
+        s = x if s is None else self._alpha * x + (1.0 - self._alpha) * s
+        self._s = s
+        return s
+
+
+@dataclass(slots=True)
+class GameState:
+    armed: bool = False
+
+    # ACTUAL readings
+    last_seen_kg: Optional[float] = None
+    smoothed_kg: Optional[float] = None
+
+    # DISPLAY numbers
+    display_kg: Optional[float] = None
+    baseline_display_kg: Optional[float] = None
+
+    # Hidden detection baselines (ACTUAL-based)
+    arming_actual_kg: Optional[float] = None
+    capped_arm_actual_kg: Optional[float] = None
+    drop_limit_actual_kg: Optional[float] = None
+    restore_limit_actual_kg: Optional[float] = None
+
+    # timers & flags
+    is_below: bool = False
+    above_start: float = 0.0
+    below_start: float = 0.0
+    above_limit_start: float = 0.0
+    updated: float = 0.0
+    last_ascii: str = ""
+
+
+state = GameState()
+_STATE_FIELDS = tuple(f.name for f in fields(GameState))
+# Specialized comparison network for the shipped window size; the general
+# heap-based smoother covers any other SMOOTH_WINDOW; EMA is opt-in.
+if SMOOTH_MODE == "ema":
+    smoother = Ewma(EMA_ALPHA)
+elif SMOOTH_WINDOW == 4:
+    smoother = Median4()
+elif SMOOTH_WINDOW >= 16 and np is not None:
+    smoother = PartitionMedian(SMOOTH_WINDOW)
+else:
+    smoother = StreamingMedian(SMOOTH_WINDOW)
+lock = threading.Lock()
+stop_flag = False
+
+# Latest whole-state snapshot, republished by every writer while it holds
+# the lock. The one-element slot is swapped with a single assignment -
+# atomic under the GIL - so HTTP readers never touch the lock at all.
+_snap: List[dict] = [{}]
+
+
+def _publish_snapshot_locked():
+    _snap[0] = {k: getattr(state, k) for k in _STATE_FIELDS}
+
+
+_publish_snapshot_locked()
+
+# Set whenever the state advances; SSE clients wake on it instead of polling
+_state_changed = threading.Event()
+
+
+def reader_loop():
+    global stop_flag
+
+    try:
+        ser = serial.Serial(
+            port=COM_PORT,
+            baudrate=BAUD,
+            bytesize=BYTESIZE,
+            parity=PARITY,
+            stopbits=STOPBITS,
+            # the in_waiting-or-1 read returns the moment a byte arrives,
+            # so a long idle timeout just means fewer phantom wakeups
+            timeout=1.0,
+            rtscts=False,
+            dsrdtr=False,
+            xonxoff=False,
+        )
+    except Exception as e:
+        print(f"\n[!] ERROR opening {COM_PORT}: {e}")
+        sys.exit(1)
+
+    # Bigger driver-side RX buffer (Windows/pyserial only) so a burst
+    # survives a scheduling hiccup without overrun
+    if hasattr(ser, "set_buffer_size"):
+        try:
+            ser.set_buffer_size(rx_size=65536)
+        except Exception:
+            pass
+
+    print(f"\nConnected: {COM_PORT} @ {BAUD} {'7E1' if USE_7E1 else '8N1'}")
+    print(f"Arming when ACTUAL ≥ {MIN_TRIGGER_KG:.1f} kg for {STABLE_SECONDS:.1f}s")
+    print(f"Display = round_nearest(actual × {DISPLAY_FACTOR:.2f}, {DISPLAY_STEP_KG:.1f}kg)")
+    print(f"DROP if ACTUAL < {int(DROP_FACTOR*100)}% of capped arming actual (hold {DROP_HOLDDOWN_S:.2f}s)")
+    print(f"RESTORE if ACTUAL ≥ {int(RESTORE_FACTOR*100)}% of capped arming actual (hold {RESTORE_HOLDDOWN_S:.2f}s)")
+    print(f"Overlay: http://{LISTEN_HOST}:{LISTEN_PORT}/ API endpoints: /api/state /api/disarm /api/dev/arm/<kg>\n")
+
+    # Fixed-capacity parse buffer: bytes land at 'cursor', everything below
+    # 'consumed' has already been matched. The buffer is never reallocated;
+    # the live region is shifted down in place when the dead prefix grows.
+    # On POSIX the serial fd can sit in a selector: non-blocking reads plus
+    # a bounded select() means bursts drain the moment they arrive and
+    # stop_flag is honored within 0.5s. Windows ports expose no usable
+    # fileno(), so there the blocking-read timeout path stays.
+    sel = None
+    try:
+        sel = selectors.DefaultSelector()
+        sel.register(ser.fileno(), selectors.EVENT_READ)
+        ser.timeout = 0
+    except (OSError, ValueError, NotImplementedError):
+        sel = None
+
+    buf = bytearray(BUF_CAP)
+    cursor = 0
+    consumed = 0
+
+    while not stop_flag:
+        try:
+            if sel is not None and not sel.select(timeout=0.5):
+                continue
+            # Drain whatever the kernel already has; the read(1) path blocks
+            # (up to the 1.0s idle timeout) only when the line is idle, so
+            # bursts arrive in one syscall instead of many small wakeups.
+            chunk = ser.read(ser.in_waiting or 1)
+            if chunk:
+                n = len(chunk)
+                if n >= BUF_CAP:
+                    chunk = chunk[-BUF_CAP:]
+                    n = len(chunk)
+                    cursor = consumed = 0
+                if cursor + n > BUF_CAP:
+                    # out of room: drop the consumed prefix, then the
+                    # oldest unconsumed bytes if still short
+                    live = cursor - consumed
+                    buf[:live] = buf[consumed:cursor]
+                    cursor = live
+                    consumed = 0
+                    if cursor + n > BUF_CAP:
+                        drop = cursor + n - BUF_CAP
+                        buf[:cursor - drop] = buf[drop:cursor]
+                        cursor -= drop
+                buf[cursor:cursor + n] = chunk
+                cursor += n
+
+                # Cheap sentinel probe before invoking the regex engine:
+                # every frame starts with '=', so if the unscanned region
+                # has none, those bytes can never match and are consumed
+                # outright. C-level find beats a regex scan by far.
+                if buf.find(b"=", consumed, cursor) < 0:
+                    consumed = cursor
+                    continue
+
+                # Scan only the bytes we haven't looked at yet
+                matches = []
+                for m in PAT.finditer(buf, consumed, cursor):
+                    end = m.end()
+                    if end == cursor or (end == cursor - 1
+                                         and buf[cursor - 1] == 0x2E):
+                        # the trailing number may still be arriving; leave
+                        # it for the next chunk and rescan from its '='.
+                        # The second test covers a read boundary falling
+                        # right after the wire dot ('=5.' + '21000'): the
+                        # capture can't include a trailing dot, so the
+                        # match ends one byte short of the buffer there.
+                        consumed = m.start()
+                        break
+                    matches.append(m.group(1))
+                    consumed = end
+
+                if not matches and cursor - consumed > 256:
+                    # garbage stream; keep only a short tail in case a
+                    # frame straddles it
+                    consumed = cursor - 64
+
+                # amortized compaction once the dead prefix dominates
+                if consumed >= COMPACT_AT:
+                    live = cursor - consumed
+                    buf[:live] = buf[consumed:cursor]
+                    cursor = live
+                    consumed = 0
+
+                if matches:
+                    # Only the newest reading in a chunk feeds the game:
+                    # anything older is already stale by the time the bytes
+                    # arrived, and pushing a same-instant batch through the
+                    # median just biases the window toward that burst. One
+                    # parse and one lock cycle per chunk, not per match.
+                    raw = matches[-1]
+                    actual_kg = parse_rev(raw)
+                    if actual_kg is not None:
+                        now = time.monotonic()
+                        with lock:
+                            state.last_seen_kg = actual_kg
+                            state.last_ascii = raw.decode("ascii", "ignore")
+
+                            smoothed = smoother.push(actual_kg)
+                            state.smoothed_kg = smoothed
+                            # display_round_nearest, inlined: this is the
+                            # one per-sample call site
+                            state.display_kg = (
+                                round(smoothed * _DISPLAY_MUL) * DISPLAY_STEP_KG
+                            )
+                            state.updated = now
+
+                            step_state_machine_locked(smoothed, now)
+                            _publish_snapshot_locked()
+
+                        _state_changed.set()
+
+        except KeyboardInterrupt:
+            stop_flag = True
+        except Exception as e:
+            print(f"\n[!] Serial read error: {e}")
+            time.sleep(0.2)
+
+    if sel is not None:
+        sel.close()
+    try:
+        ser.close()
+    except Exception:
+        pass
+    print("\nSerial closed.")
+
+
+def status_loop():
+    """Console heartbeat in its own thread: snapshot under the lock, format
+    and write outside it, so a blocked stdout never stalls the reader."""
+    while not stop_flag:
+        time.sleep(0.5)
+        with lock:
+            disp = state.display_kg
+            armed = state.armed
+            is_below = state.is_below
+            drop_l = state.drop_limit_actual_kg
+            rest_l = state.restore_limit_actual_kg
+            base_d = state.baseline_display_kg
+
+        if disp is None:
+            continue
+
+        if not armed:
+            line = (f"display {disp:7.1f} kg | waiting ACTUAL ≥ "
+                    f"{MIN_TRIGGER_KG:.1f} for {STABLE_SECONDS:.1f}s")
+        else:
+            side = "below" if is_below else "above"
+            drop_l = drop_l or float("nan")
+            rest_l = rest_l or float("nan")
+            base_d = base_d if base_d is not None else float("nan")
+            line = (f"display {disp:7.1f} | baseline {base_d:7.1f} | "
+                    f"ACTUAL drop<{drop_l:6.1f} / restore≥{rest_l:6.1f} ({side})")
+
+        sys.stdout.write(line + "\r")
+        sys.stdout.flush()
+
+
+# Decision-core event codes; the Python wrapper does the side effects
+# (presses, prints, baseline bookkeeping) so the jitted code stays pure.
+_EV_NONE = 0
+_EV_ARMED = 1
+_EV_DROP = 2
+_EV_RESTORE = 3
+
+
+@njit(cache=True)
+def _sm_step(armed, is_below, above_start, below_start, above_limit_start,
+             actual, now, min_trigger, stable_s,
+             drop_limit, restore_limit, drop_hold, restore_hold):
+    """Pure-scalar state-machine tick: comparisons, timer math, nothing
+    else. drop/restore limits use -1.0 as the "not set" sentinel (weights
+    are >= 0). Returns the five mutable fields plus an event code."""
+    event = _EV_NONE
+
+    # ----- Not armed yet -----
+    if not armed:
+        if actual >= min_trigger:
+            if above_start == 0.0:
+                above_start = now
+
+            if (now - above_start) >= stable_s:
+                armed = True
+                is_below = False
+                below_start = 0.0
+                above_limit_start = 0.0
+                event = _EV_ARMED
+        elif above_start:
+            above_start = 0.0
+
+        return armed, is_below, above_start, below_start, above_limit_start, event
+
+    # ----- Armed: enforce thresholds -----
+    if drop_limit < 0.0 or restore_limit < 0.0:
+        return armed, is_below, above_start, below_start, above_limit_start, event
+
+    # Steady state (nothing crossing a boundary) is 99%+ of samples: bail
+    # out with at most one store.
+    if is_below:
+        # Look for RESTORE
+        if actual < restore_limit:
+            if above_limit_start:
+                above_limit_start = 0.0
+            return armed, is_below, above_start, below_start, above_limit_start, event
+
+        if above_limit_start == 0.0:
+            above_limit_start = now
+
+        if (now - above_limit_start) >= restore_hold:
+            is_below = False
+            below_start = 0.0
+            above_limit_start = 0.0
+            event = _EV_RESTORE
+
+    else:
+        # Look for DROP
+        if actual >= drop_limit:
+            if below_start:
+                below_start = 0.0
+            return armed, is_below, above_start, below_start, above_limit_start, event
+
+        if below_start == 0.0:
+            below_start = now
+
+        if (now - below_start) >= drop_hold:
+            is_below = True
+            below_start = 0.0
+            above_limit_start = 0.0
+            event = _EV_DROP
+
+    return armed, is_below, above_start, below_start, above_limit_start, event
+
+
+def step_state_machine_locked(actual: float, now: float):
+    """Advance the state machine one sample. The caller holds the lock and
+    passes the smoothed weight and timestamp. The branchy scalar work runs
+    in _sm_step (JIT-compiled when numba is present); this wrapper writes
+    back the mutable fields and performs transition side effects."""
+    drop_limit = state.drop_limit_actual_kg
+    restore_limit = state.restore_limit_actual_kg
+
+    armed, is_below, above_start, below_start, above_limit_start, event = \
+        _sm_step(state.armed, state.is_below, state.above_start,
+                 state.below_start, state.above_limit_start,
+                 actual, now, MIN_TRIGGER_KG, STABLE_SECONDS,
+                 drop_limit if drop_limit is not None else -1.0,
+                 restore_limit if restore_limit is not None else -1.0,
+                 DROP_HOLDDOWN_S, RESTORE_HOLDDOWN_S)
+
+    state.armed = armed
+    state.is_below = is_below
+    state.above_start = above_start
+    state.below_start = below_start
+    state.above_limit_start = above_limit_start
+
+    if event == _EV_NONE:
+        return
+
+    if event == _EV_ARMED:
+        state.arming_actual_kg = actual
+        capped = min(actual, 112.0)
+        state.capped_arm_actual_kg = capped
+        state.drop_limit_actual_kg = capped * DROP_FACTOR
+        state.restore_limit_actual_kg = capped * RESTORE_FACTOR
+
+        if actual > 112.0:
+            state.baseline_display_kg = 100.0
+        else:
+            state.baseline_display_kg = display_round_nearest(actual)
+
+        press_q.put_nowait(EP_TRAPPED)
+
+        print(
+            f"\n[ARMED] ACTUAL={actual:.2f} shown_at_arm={display_round_nearest(actual):.2f} "
+            f"baseline_display={state.baseline_display_kg:.2f} "
+            f"capForThresh={state.capped_arm_actual_kg:.2f} "
+            f"drop<{state.drop_limit_actual_kg:.2f} restore≥{state.restore_limit_actual_kg:.2f}"
+        )
+    elif event == _EV_RESTORE:
+        press_q.put_nowait(EP_RESTORE)
+        print(f"\n[RESTORE] actual {actual:.2f} ≥ {restore_limit:.2f}")
+    elif event == _EV_DROP:
+        press_q.put_nowait(EP_DROP)
+        print(f"\n[DROP] actual {actual:.2f} < {drop_limit:.2f}")
+
+
+def _reset_state():
+    with lock:
+        state.armed = False
+        state.last_seen_kg = None
+        state.smoothed_kg = None
+        state.display_kg = None
+        state.baseline_display_kg = None
+        state.arming_actual_kg = None
+        state.capped_arm_actual_kg = None
+        state.drop_limit_actual_kg = None
+        state.restore_limit_actual_kg = None
+
+        state.is_below = False
+        state.above_start = 0.0
+        state.below_start = 0.0
+        state.above_limit_start = 0.0
+
+        state.updated = time.monotonic()
+        state.last_ascii = ""
+        smoother.clear()
+        _publish_snapshot_locked()
+
+    _state_changed.set()
+    print("\n[DISARM] state reset.")
+
+
+# =================== Flask (HTML + API) ======================
+
+app = Flask(__name__)
+
+
+def _json(o) -> Response:
+    """jsonify replacement: orjson encode straight into a Response."""
+    return app.response_class(orjson.dumps(o), mimetype="application/json")
+
+HTML = """<!doctype html>
+<meta charset="utf-8">
+<title>Weight Game</title>
+<style>
+:root{color-scheme:dark}
+html,body{margin:0;height:100%;background:transparent;color:#eee;font-family:system-ui,-apple-system,Segoe UI,Roboto,Arial,sans-serif}
+.wrap{display:flex;flex-direction:column;justify-content:center;align-items:center;height:100%;text-align:center}
+.big{font-size:12vmin;font-weight:800;letter-spacing:.02em;text-shadow:0 0 10px rgba(0,0,0,.35)}
+.row{display:flex;gap:1.2rem;margin-top:1.0rem;flex-wrap:wrap;justify-content:center}
+.card{min-width:20ch;padding:.6rem 1rem;border:1px solid #333;border-radius:12px;background:rgba(0,0,0,.35)}
+.label{font-size:2.2vmin;opacity:.85}
+.value{font-size:5.6vmin;font-weight:700;margin-top:.2rem}
+.banner{font-size:4.2vmin;font-weight:800;letter-spacing:.04em;margin:1.2rem 0 .6rem;padding:.4rem 1rem;border-radius:12px;border:2px solid #333;background:rgba(0,0,0,.45);display:none}
+.banner.on{display:inline-block}
+.banner.trapped{border-color:#244;color:#7bd3ff;}
+.banner.escape{border-color:#550;color:#ff5f58;}
+@keyframes pulse {0%{opacity:1}50%{opacity:.7;filter:drop-shadow(0 0 10px #d00)}100%{opacity:1;filter:none}}
+.escape.flash {animation: pulse .9s ease-in-out infinite;}
+.note{margin-top:1.0rem;font-size:2.8vmin;color:#ddd;max-width:70vw;text-align:center;line-height:1.2;display:none}
+.note.on{display:block}
+.twolines{white-space:pre-line}
+</style>
+
+<div class="wrap">
+  <div class="big" id="kg">--.- kg</div>
+
+  <div id="bannerTrapped" class="banner trapped">BABY TRAPPED!</div>
+  <div id="bannerEscape" class="banner escape">BABY TRYING TO ESCAPE</div>
+
+  <div class="row" id="after" style="display:none">
+    <div class="card">
+      <div class="label">BASELINE</div>
+      <div id="baseline" class="value">--.- kg</div>
+    </div>
+  </div>
+
+  <div id="msg" class="note twolines">
+    If the display weight drops below the baseline, all doors will lock until the weight is restored.
+  </div>
+</div>
+
+<script>
+let lastArmed = false;
+
+function fmt1(x){
+  return (x!==null&&x!==undefined) ? Number(x).toFixed(1) : "--.-";
+}
+
+function render(d){
+    document.getElementById('kg').textContent = fmt1(d.display_kg) + ' kg';
+
+    const armed = !!d.armed;
+    const trapped = document.getElementById('bannerTrapped');
+    const escape = document.getElementById('bannerEscape');
+    const after = document.getElementById('after');
+    const msg = document.getElementById('msg');
+
+    if (armed && !lastArmed) {
+        after.style.display = 'flex';
+        msg.classList.add('on');
+    }
+    if (!armed && lastArmed) {
+        after.style.display = 'none';
+        msg.classList.remove('on');
+        trapped.classList.remove('on');
+        escape.classList.remove('on','flash');
+        document.getElementById('baseline').textContent = "--.- kg";
+    }
+    lastArmed = armed;
+
+    if (armed){
+      document.getElementById('baseline').textContent = fmt1(d.baseline_display_kg) + ' kg';
+
+      const currentlyBelow = (d.is_below === true) || (d.below_start > 0);
+
+      trapped.classList.toggle('on', !currentlyBelow);
+      escape.classList.toggle('on', currentlyBelow);
+      escape.classList.toggle('flash', currentlyBelow);
+    }
+}
+
+// Server pushes state over SSE; one fetch seeds the initial view.
+fetch('/api/state',{cache:'no-store'}).then(r=>r.json()).then(render).catch(()=>{});
+const es = new EventSource('/api/stream');
+es.onmessage = (ev) => { try{ render(JSON.parse(ev.data)); }catch(e){} };
+</script>
+"""
+
+
+# The page has no template variables; encode once and let browsers cache
+_HTML_BYTES = HTML.encode("utf-8")
+_HTML_ETAG = hashlib.md5(_HTML_BYTES).hexdigest()
+
+
+@app.route("/")
+def index():
+    if request.headers.get("If-None-Match") == _HTML_ETAG:
+        return Response(status=304, headers={"ETag": _HTML_ETAG})
+    return Response(_HTML_BYTES, mimetype="text/html",
+                    headers={"ETag": _HTML_ETAG,
+                             "Cache-Control": "public, max-age=3600"})
+
+
+# The config never changes after import; build it once instead of per hit.
+_CONFIG = dict(
+    MIN_TRIGGER_KG=MIN_TRIGGER_KG,
+    STABLE_SECONDS=STABLE_SECONDS,
+    DISPLAY_FACTOR=DISPLAY_FACTOR,
+    DISPLAY_STEP_KG=DISPLAY_STEP_KG,
+    DROP_FACTOR=DROP_FACTOR,
+    RESTORE_FACTOR=RESTORE_FACTOR,
+    DROP_HOLDDOWN_S=DROP_HOLDDOWN_S,
+    RESTORE_HOLDDOWN_S=RESTORE_HOLDDOWN_S,
+    SMOOTH_WINDOW=SMOOTH_WINDOW,
+    EP_DROP=EP_DROP,
+    EP_RESTORE=EP_RESTORE,
+    EP_TRAPPED=EP_TRAPPED,
+)
+_CONFIG_BODY = orjson.dumps(_CONFIG)
+
+# (timestamp, body) published as one tuple so readers never see a torn pair
+_state_cache = [(0.0, b"")]
+_STATE_TTL_S = 0.05
+
+
+def _state_body(now: float) -> bytes:
+    # writers publish snapshots whole, so this is a plain read + copy
+    d = _snap[0].copy()
+    d["now"] = now  # same clock as state.updated
+    return orjson.dumps(d)
+
+
+@app.get("/api/state")
+def api_state():
+    now = time.monotonic()
+    ts, body = _state_cache[0]
+    if body and now - ts < _STATE_TTL_S:
+        return Response(body, mimetype="application/json")
+
+    body = _state_body(now)
+    _state_cache[0] = (now, body)
+    return Response(body, mimetype="application/json")
+
+
+@app.get("/api/config")
+def api_config():
+    # Constants only change with a restart; let clients cache for an hour
+    return Response(_CONFIG_BODY, mimetype="application/json",
+                    headers={"Cache-Control": "max-age=3600"})
+
+
+@app.get("/api/stream")
+def api_stream():
+    """Server-sent events: push state when it changes instead of making
+    every viewer poll. Idle scale => idle wire."""
+    def gen():
+        last_updated = None
+        idle = 0
+        while True:
+            # the Event is a wakeup hint shared by all clients; the
+            # updated-stamp compare is what decides whether to send, so a
+            # racing clear() from another client only costs one wait cycle
+            _state_changed.wait(0.25)
+            _state_changed.clear()
+            upd = _snap[0].get("updated")
+            if upd == last_updated:
+                idle += 1
+                if idle >= 60:  # ~15s silent: comment line keeps proxies
+                    idle = 0    # and EventSource from timing the stream out
+                    yield b": keepalive\n\n"
+                continue
+            idle = 0
+            last_updated = upd
+            yield b"data: " + _state_body(time.monotonic()) + b"\n\n"
+
+    return Response(stream_with_context(gen()),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+
+@app.route("/api/disarm", methods=["POST", "GET"])
+def api_disarm():
+    _reset_state()
+    return _json(dict(ok=True, msg="disarmed/reset"))
+
+
+@app.route("/api/reset", methods=["POST", "GET"])
+def api_reset():
+    _reset_state()
+    return _json(dict(ok=True, msg="reset"))
+
+
+# ====== DEV HELPERS ======
+
+@app.route("/api/dev/arm/<float:actual>", methods=["POST","GET"])
+def dev_arm(actual):
+    with lock:
+        capped = min(actual, 112.0)
+        drop = capped * DROP_FACTOR
+        rest = capped * RESTORE_FACTOR
+
+        if actual > 112.0:
+            baseline_display = 100.0
+        else:
+            baseline_display = round(
+                round((actual * DISPLAY_FACTOR) / DISPLAY_STEP_KG) * DISPLAY_STEP_KG, 2
+            )
+
+        state.armed = True
+        state.arming_actual_kg = actual
+        state.capped_arm_actual_kg = capped
+        state.drop_limit_actual_kg = drop
+        state.restore_limit_actual_kg= rest
+
+        state.baseline_display_kg = baseline_display
+        state.display_kg = baseline_display
+
+        state.is_below = False
+        state.above_start = state.below_start = state.above_limit_start = 0.0
+        state.updated = time.monotonic()
+        _publish_snapshot_locked()
+        _state_changed.set()
+
+        return _json(dict(
+            ok=True,
+            armed=True,
+            arming_actual=actual,
+            baseline_display_kg=baseline_display,
+            drop_limit_actual_kg=drop,
+            restore_limit_actual_kg=rest,
+        ))
+
+
+@app.route("/api/dev/disarm", methods=["POST","GET"])
+def dev_disarm():
+    _reset_state()
+    return _json(dict(ok=True, armed=False))
+
+
+def main():
+    t = threading.Thread(target=reader_loop, daemon=True)
+    t.start()
+
+    threading.Thread(target=companion_worker, daemon=True).start()
+
+    # Opt-in: the carriage-return heartbeat only helps when someone is
+    # watching a terminal; headless deployments skip the thread entirely.
+    if os.environ.get("STATUS_CONSOLE") == "1":
+        threading.Thread(target=status_loop, daemon=True).start()
+
+    print(f"HTTP ready at http://{LISTEN_HOST}:{LISTEN_PORT} "
+          f"(/, /api/state, /api/disarm, /api/dev/arm/<kg>)")
+
+    try:
+        from waitress import serve
+    except ImportError:
+        # dev-server fallback; thread-per-request, fine for a single viewer
+        app.run(host=LISTEN_HOST, port=LISTEN_PORT, debug=False,
+                threaded=True)
+    else:
+        # pre-spawned threadpool: less per-request overhead competing with
+        # the reader for the GIL. Threads sized for SSE clients, which
+        # each hold one for their connection's lifetime.
+        serve(app, host=LISTEN_HOST, port=LISTEN_PORT, threads=8,
+              connection_limit=32)
+
+
+if __name__ == "__main__":
+    main()